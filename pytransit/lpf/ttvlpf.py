@@ -16,25 +16,149 @@
 
 import seaborn as sb
 from matplotlib.pyplot import subplots, setp
-from numpy import pi, sign, cos, sqrt, sin, array, arccos, inf, round, int, s_, percentile, concatenate, median, mean, \
-    arange, poly1d, polyfit
+from numpy import pi, cos, sqrt, sin, tan, array, arccos, inf, round, int, s_, concatenate, median, any, mean, \
+    arange, poly1d, polyfit, empty_like, rint, empty, sort, floor
 
 from numba import njit, prange
+from scipy.constants import G
 from .lpf import BaseLPF
 from ..models.transitmodel import TransitModel
 from ..param.parameter import ParameterSet, PParameter, GParameter
 from ..param.parameter import UniformPrior as U, NormalPrior as N, GammaPrior as GM
-from ..orbits.orbits_py import as_from_rhop
+from ..orbits.orbits_py import as_from_rhop, D_S
+
+try:
+    import jax
+    import jax.numpy as jnp
+    from jax import jit
+    with_jax = True
+except ImportError:
+    with_jax = False
 
 with_seaborn = True
 
-@njit("f8[:](f8[:], f8, f8, f8, f8[:], i8[:])", cache=False, parallel=False)
+@njit(cache=False, fastmath=True)
+def cos_phase_s(dt, p):
+    # Reduce the phase to [-0.5, 0.5] so that tan always works in its fast range
+    ph = dt / p
+    ph -= rint(ph)
+    # With the angle θ = 2π·ph and u = 1 / (1 + tan²(θ/2)):
+    # cos(θ) = (1 - tan²(θ/2)) / (1 + tan²(θ/2)) = 2u - 1
+    th = tan(pi * ph)
+    return 2.0 / (1.0 + th*th) - 1.0
+
+
+@njit(cache=False, fastmath=True)
+def z_circular_ttv_s(dt, p, a, s2i):
+    cosph = cos_phase_s(dt, p)
+    return (1.0 if cosph >= 0.0 else -1.0) * a * sqrt(1.0 - cosph*cosph*s2i)
+
+
+@njit("f8[:](f8[:], f8, f8, f8, f8[:], i8[:])", cache=False, parallel=True, fastmath=True)
 def z_circular_ttv(t, p, a, i, tc, tcid):
-    cosph = cos(2*pi * (t - tc[tcid]) / p)
-    z = sign(cosph) * a * sqrt(1.0 - cosph * cosph * sin(i) ** 2)
+    s2i = sin(i)**2
+    z = empty_like(t)
+    for k in prange(t.size):
+        z[k] = z_circular_ttv_s(t[k] - tc[tcid[k]], p, a, s2i)
+    return z
+
+
+@njit("f8[:](f8[:], f8, f8, f8, f8[:], i8[:])", cache=False, parallel=True, fastmath=True)
+def z2_circular_ttv(t, p, a, i, tc, tcid):
+    """Squared circular-orbit z for a TTV model.
+
+    Avoids the square root for the cases where only the distance matters, such as testing
+    whether z < 1 + k. The sign of z (positive near the transit, negative near the
+    occultation) is lost.
+    """
+    a2 = a*a
+    s2i = sin(i)**2
+    z2 = empty_like(t)
+    for k in prange(t.size):
+        cosph = cos_phase_s(t[k] - tc[tcid[k]], p)
+        z2[k] = a2 * (1.0 - cosph*cosph*s2i)
+    return z2
+
+
+@njit("f8[:](f8[:], f8, f8, f8, f8[:], i8[:])", cache=False, parallel=True, fastmath=True)
+def z_circular_ttv_sliced(t, p, a, i, tc, lcbounds):
+    """Circular-orbit z for a TTV model with the light curves stored as contiguous slices.
+
+    The samples of light curve j are t[lcbounds[j]:lcbounds[j+1]], and each light curve
+    has its own transit centre tc[j]. The light curves are processed in parallel.
+    """
+    s2i = sin(i)**2
+    z = empty_like(t)
+    for j in prange(tc.size):
+        tcj = tc[j]
+        for k in range(lcbounds[j], lcbounds[j+1]):
+            z[k] = z_circular_ttv_s(t[k] - tcj, p, a, s2i)
+    return z
+
+
+@njit(cache=False, fastmath=True)
+def z_circular_ttv_recur(t, p, a, s2i, tc, tcid, reseed=32):
+    """Circular-orbit z for a TTV model using an angle-sum recurrence.
+
+    Steps cos and sin of the phase forward with the angle-sum identities inside each run of
+    samples sharing the same transit index, so that only two multiply-adds are needed per
+    point on a uniform cadence. The phase is recomputed directly at the start of each run,
+    every `reseed` steps, and whenever the cadence changes to keep the accumulated error bounded.
+    """
+    npt = t.size
+    z = empty_like(t)
+    w = 2*pi / p
+    c, s, c1, s1, dt = 0.0, 0.0, 1.0, 0.0, 0.0
+    nstep = 0
+    for k in range(npt):
+        if (k > 0 and tcid[k] == tcid[k-1] and nstep < reseed
+                and abs((t[k] - t[k-1]) - dt) <= 1e-6 * abs(dt)):
+            c, s = c*c1 - s*s1, s*c1 + c*s1
+            nstep += 1
+        else:
+            ph = (t[k] - tc[tcid[k]]) / p
+            ph = 2*pi * (ph - rint(ph))
+            c, s = cos(ph), sin(ph)
+            nstep = 0
+            if k + 1 < npt and tcid[k+1] == tcid[k]:
+                dt = t[k+1] - t[k]
+                c1, s1 = cos(w*dt), sin(w*dt)
+        z[k] = (1.0 if c >= 0.0 else -1.0) * a * sqrt(1.0 - c*c*s2i)
     return z
 
 
+@njit(parallel=True, cache=False)
+def multi_percentile(x, q):
+    """Percentiles `q` of each column of a 2D array computed with a single sort per column.
+
+    Uses the same linear interpolation as `numpy.percentile`, and the columns are processed in parallel.
+    """
+    nr, nc = x.shape
+    p = empty((q.size, nc))
+    for j in prange(nc):
+        xs = sort(x[:, j])
+        for i in range(q.size):
+            r = 0.01 * q[i] * (nr - 1)
+            k = int(floor(r))
+            if k + 1 < nr:
+                p[i, j] = xs[k] + (r - k) * (xs[k+1] - xs[k])
+            else:
+                p[i, j] = xs[nr-1]
+    return p
+
+
+if with_jax:
+    def as_from_rhop_jax(rho, period):
+        """JAX version of `as_from_rhop`."""
+        return (G/(3*pi))**(1/3) * ((period * D_S)**2 * 1e3 * rho)**(1/3)
+
+    @jit
+    def z_circular_ttv_jax(t, p, a, i, tc, tcid):
+        """JAX version of `z_circular_ttv` that can be differentiated with `jax.grad`."""
+        cosph = jnp.cos(2*pi * (t - tc.at[tcid].get()) / p)
+        return jnp.where(cosph >= 0.0, 1.0, -1.0) * a * jnp.sqrt(1.0 - cosph*cosph*jnp.sin(i)**2)
+
+
 def plot_estimates(x, p, ax, bwidth=0.8):
     ax.bar(x, p[4, :] - p[3, :], bwidth, p[3, :], alpha=0.25, fc='b')
     ax.bar(x, p[2, :] - p[1, :], bwidth, p[1, :], alpha=0.25, fc='b')
@@ -56,23 +180,36 @@ class TTVLPF(BaseLPF):
         self.zero_epoch = zero_epoch
         self.period = period
         self.tc_sigma = tc_sigma
+        self._ttv_cache = {}
+        self._tc_col_idx = None
         super().__init__(target, passbands, times, fluxes, pbids, tm, nsamples, exptime)
 
+    def _init_parameters(self):
+        # The parameter layout changes when the parametrisation is recreated (e.g. by remove_transits),
+        # so the cached transit centre columns and the posterior reductions are no longer valid.
+        self._tc_col_idx = None
+        self._ttv_cache = {}
+        super()._init_parameters()
+
     def _init_p_orbit(self):
         """Orbit parameter initialisation for a TTV model.
         """
         porbit = [GParameter('rho', 'stellar_density', 'g/cm^3', U(0.1, 25.0), (0, inf)),
                   GParameter('b', 'impact_parameter', 'R_s', U(0.0, 1.0), (0, 1))]
 
-        s = self.tc_sigma
         self.tnumber = round((array([t.mean() for t in self.times]) - self.zero_epoch) / self.period).astype(int)
         tcs = self.period * self.tnumber + self.zero_epoch
-        for tc, tn in zip(tcs, self.tnumber):
-            porbit.append(GParameter(f'tc_{tn:d}', f'transit_centre_{tn:d}', 'd', N(tc, s), (-inf, inf)))
+        tcp = N(0.0, self.tc_sigma)
+        porbit += [GParameter(f'tc_{tn:d}', f'transit_centre_{tn:d}', 'd', tcp.with_mean(tc), (-inf, inf))
+                   for tc, tn in zip(tcs, self.tnumber)]
         self.ps.add_global_block('orbit', porbit)
         self._start_tc = 2
         self._sl_tc = s_[self._start_tc:self._start_tc + self.nlc]
 
+    def _init_data(self, *args, **kwargs):
+        super()._init_data(*args, **kwargs)
+        self._lcbounds = array([0] + [sl.stop for sl in self.lcslices], 'int64')
+
     def optimize_times(self, window):
         times, fluxes, pbids = [], [], []
         tcp = self.ps[self._sl_tc]
@@ -90,7 +227,28 @@ class TTVLPF(BaseLPF):
         else:
             i = arccos(pv[1] / a)
             tc = pv[self._sl_tc]
-            return z_circular_ttv(self.timea, self.period, a, i, tc, self.lcida)
+            return z_circular_ttv_sliced(self.timea, self.period, a, i, tc, self._lcbounds)
+
+    def _compute_z_jax(self, pv):
+        """Differentiable version of `_compute_z` using JAX.
+
+        Unlike `_compute_z`, this method does not check whether the semi-major axis is physical,
+        since the check can't be traced by JAX. The caller needs to reject the parameter vectors
+        with a < 1 (or a < b, for which the inclination is nan).
+
+        Requires JAX with 64-bit floats enabled (`jax.config.update('jax_enable_x64', True)`). The
+        times and transit centres are absolute times, and float32 can't resolve them (the float32
+        spacing is ~0.25 d at BJD ~2.45e6).
+        """
+        if not with_jax:
+            raise ImportError('TTVLPF._compute_z_jax requires JAX.')
+        if not jax.config.jax_enable_x64:
+            raise RuntimeError("TTVLPF._compute_z_jax requires 64-bit floats in JAX, enable them with "
+                               "jax.config.update('jax_enable_x64', True).")
+        a = as_from_rhop_jax(pv[0], self.period)
+        i = jnp.arccos(pv[1] / a)
+        tc = pv[self._sl_tc]
+        return z_circular_ttv_jax(self.timea, self.period, a, i, tc, self.lcids)
 
     def plot_light_curve(self, ax=None, figsize=None, time=False):
         fig, ax = (None, ax) if ax is not None else subplots(figsize=figsize)
@@ -100,23 +258,52 @@ class TTVLPF(BaseLPF):
         fig.tight_layout()
         return ax
 
-    def posterior_period(self, burn: int = 0, thin: int = 1) -> float:
+    def sample_mcmc(self, *args, **kwargs):
+        self._ttv_cache.clear()
+        super().sample_mcmc(*args, **kwargs)
+
+    def _tc_samples(self, burn: int = 0, thin: int = 1):
+        """Transit centre posterior samples as a (nsamples, ntransits) array."""
         df = self.posterior_samples(burn, thin, derived_parameters=False)
-        tccols = [c for c in df.columns if 'tc' in c]
-        tcs = median(df[tccols], 0)
-        return mean((tcs[1:] - tcs[0]) / (self.tnumber[1:] - self.tnumber[0]))
+        if self._tc_col_idx is None:
+            names = [f'tc_{tn:d}' for tn in self.tnumber]
+            idx = df.columns.get_indexer(names)
+            if any(idx < 0):
+                missing = ', '.join(n for n, i in zip(names, idx) if i < 0)
+                raise KeyError(f'Could not find the transit centre parameters {missing}')
+            self._tc_col_idx = idx
+        return df.values[:, self._tc_col_idx]
+
+    def _ttv_reductions(self, burn: int = 0, thin: int = 1, tcs=None):
+        """Transit centre posterior reductions shared by the TTV analysis methods.
+
+        Returns the transit centre medians, the mean period, and the linear ephemeris prediction for
+        each transit. The transit centre samples are read from the sampler unless given. The results
+        are cached for the latest few (burn, thin) combinations, and the cache is cleared when the
+        MCMC sampler is run again.
+        """
+        key = (burn, thin, self.sampler.iteration)
+        if key not in self._ttv_cache:
+            tcs = self._tc_samples(burn, thin) if tcs is None else tcs
+            tcm = median(tcs, 0)
+            period = mean((tcm[1:] - tcm[0]) / (self.tnumber[1:] - self.tnumber[0]))
+            tc_linear = poly1d(polyfit(self.tnumber, tcm, 1))(self.tnumber)
+            if len(self._ttv_cache) >= 4:
+                del self._ttv_cache[next(iter(self._ttv_cache))]
+            self._ttv_cache[key] = tcm, period, tc_linear
+        return self._ttv_cache[key]
+
+    def posterior_period(self, burn: int = 0, thin: int = 1) -> float:
+        return self._ttv_reductions(burn, thin)[1]
 
     def plot_ttvs(self, burn=0, thin=1, axs=None, figsize=None, bwidth=0.8, fmt='h', windows=None):
         assert fmt in ('d', 'h', 'min')
         multiplier = {'d': 1, 'h': 24, 'min': 1440}
         ncol = 1 if windows is None else len(windows)
         fig, axs = (None, axs) if axs is not None else subplots(1, ncol, figsize=figsize, sharey=True)
-        df = self.posterior_samples(burn, thin)
-        tccols = [c for c in df.columns if 'tc' in c]
-        tcs = median(df[tccols], 0)
-        lineph = poly1d(polyfit(self.tnumber, tcs, 1))
-        tc_linear = lineph(self.tnumber)
-        p = multiplier[fmt] * percentile(df[tccols] - tc_linear, [50, 16, 84, 0.5, 99.5], 0)
+        tcs = self._tc_samples(burn, thin)
+        tc_linear = self._ttv_reductions(burn, thin, tcs)[2]
+        p = multiplier[fmt] * (multi_percentile(tcs, array([50, 16, 84, 0.5, 99.5])) - tc_linear)
         setp(axs, ylabel='Transit center - linear prediction [{}]'.format(fmt), xlabel='Transit number')
         if windows is None:
             plot_estimates(self.tnumber, p, axs, bwidth)
@@ -17,13 +17,42 @@
 import pandas as pd
 
 from itertools import product
-from numpy import inf, array, zeros, unique, where, stack, atleast_2d, squeeze, all
+from weakref import ref
+from numba import njit
+from numpy import inf, array, zeros, unique, atleast_2d, squeeze, all, int8, log, exp, isfinite
+from numpy.random import normal, uniform
 
 from .prior import DefaultPrior, NormalPrior, UniformPrior, JeffreysPrior, LogLogisticPrior, GammaPrior
+from .prior import normal_logpdf_s, uniform_logpdf_s, jeffreys_logpdf_s, gamma_logpdf_s
+
+KERNEL_PRIORS = (NormalPrior, UniformPrior, JeffreysPrior, GammaPrior)
+
+
+@njit(cache=False)
+def lnprior_soa(pv, kind, a, b, c, lb, ub):
+    npv, npr = pv.shape
+    lnp = zeros(npv)
+    for i in range(npv):
+        for j in range(npr):
+            x = pv[i, j]
+            if not lb[j] < x < ub[j]:
+                lnp[i] = -inf
+                break
+            k = kind[j]
+            if k == 1:
+                lnp[i] += normal_logpdf_s(x, a[j], b[j], c[j])
+            elif k == 2:
+                lnp[i] += uniform_logpdf_s(x, a[j], b[j], c[j])
+            elif k == 3:
+                lnp[i] += jeffreys_logpdf_s(x, a[j], b[j], c[j])
+            elif k == 4:
+                lnp[i] += gamma_logpdf_s(x, a[j], b[j])
+    return lnp
 
 
 class Parameter:
     def __init__(self, name, description='', unit='', prior=None, bounds=(-inf, inf), **kwargs):
+        self._owners = []
         self.name = name
         self.description = description
         self.unit = unit
@@ -33,6 +62,34 @@ class Parameter:
         self.scope = kwargs.get('scope', 'global')
         assert self.scope in ['global', 'local', 'passband']
 
+    @property
+    def prior(self):
+        """Parameter prior.
+
+        Replacing the prior marks the frozen parameter sets containing the parameter for a prior
+        update. The sets cache the prior arguments, so a prior should be replaced with a new one
+        rather than modified in place.
+        """
+        return self._prior
+
+    @prior.setter
+    def prior(self, prior):
+        self._prior = prior
+        for owner in self._owners:
+            ps = owner()
+            if ps is not None:
+                ps._priors_dirty = True
+
+    def _add_owner(self, ps):
+        self._owners = [o for o in self._owners if o() is not None]
+        if not any(o() is ps for o in self._owners):
+            self._owners.append(ref(ps))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_owners'] = []
+        return state
+
     def __str__(self):
         return f"{self.pid:3d} |{self.scope[0].upper():1s}| {self.name:14s} {str(self.prior):40} [{self.bounds[0]:8.2f} .. {self.bounds[1]:8.2f}]"
 
@@ -112,6 +169,7 @@ class ParameterSet(list):
         self.blocks = []
         self.bounds = None
         self.frozen = False
+        self._priors_dirty = True
 
     def add_global_block(self, name, pars):
         start = len(self)
@@ -150,16 +208,78 @@ class ParameterSet(list):
             self.ubounds = self.bounds[:, 1]
             for i, p in enumerate(self):
                 p.pid = i
+                p._add_owner(self)
+            self._name_to_pid = {p.name: p.pid for p in self}
+            self._flatten_priors()
         else:
             raise ValueError('Trying to update a frozen ParameterSet')
 
+    def _flatten_priors(self):
+        """Flattens the parameter priors into arrays for the compiled prior evaluation.
+
+        The priors with a compiled log density kernel are stored as a prior type code and up to
+        three kernel arguments per parameter, and the remaining priors are evaluated one by one.
+        Only the exact built-in prior classes use the compiled kernels (and the grouped sampling),
+        so that subclasses overriding `logpdf` or `rvs` are always evaluated through their own methods.
+        The arrays are rebuilt automatically when a parameter prior is replaced (see `Parameter.prior`),
+        but changes made to a prior object in place are not detected.
+        """
+        n = len(self)
+        self._prior_kind = zeros(n, int8)
+        self._prior_args = zeros((3, n))
+        self._other_priors = []
+        for i, p in enumerate(self):
+            if type(p.prior) in KERNEL_PRIORS:
+                self._prior_kind[i] = p.prior._kind
+                self._prior_args[:len(p.prior._kernel_args), i] = p.prior._kernel_args
+            elif type(p.prior) is not DefaultPrior:
+                self._other_priors.append((i, p.prior))
+
+        # Prior sampling groups: the normal, uniform, and Jeffreys priors are sampled with a single
+        # random number generator call per group, and the rest (except the default prior) one by one.
+        nps, ups, jps = [], [], []
+        self._rvs_other = []
+        for i, p in enumerate(self):
+            if type(p.prior) is NormalPrior:
+                nps.append((i, p.prior.mean, p.prior.std))
+            elif type(p.prior) is UniformPrior:
+                ups.append((i, p.prior.a, p.prior.b))
+            elif type(p.prior) is JeffreysPrior:
+                jps.append((i, log(p.prior.x0), log(p.prior.x1)))
+            elif type(p.prior) is not DefaultPrior:
+                self._rvs_other.append((i, p.prior))
+        self._rvs_normal = self._rvs_group(nps)
+        self._rvs_uniform = self._rvs_group(ups)
+        self._rvs_jeffreys = self._rvs_group(jps)
+        self._priors_dirty = False
+
+    @staticmethod
+    def _rvs_group(group):
+        pids, a, b = zip(*group) if group else ((), (), ())
+        return array(pids, int), array(a, float), array(b, float)
+
     def lnprior(self, pv):
         pv = atleast_2d(pv)
-        lnp = zeros(pv.shape[0])
-        m = all(pv > self.bounds[:, 0], 1) & all(pv < self.bounds[:, 1], 1)
-        for i, p in enumerate(self):
-            lnp += p.lnprior(pv[:, i])
-        return squeeze(where(m, lnp, -inf))
+        if self._priors_dirty or not self.frozen:
+            self._flatten_priors()
+        if not pv.shape[1] == self._prior_kind.size == self.lbounds.size:
+            raise ValueError(f'The parameter vector length ({pv.shape[1]}) does not match the number of parameters '
+                             f'({self._prior_kind.size}) and bounds ({self.lbounds.size}), refreeze the parameter set '
+                             f'if it has been modified.')
+        lnp = lnprior_soa(pv, self._prior_kind, self._prior_args[0], self._prior_args[1], self._prior_args[2],
+                          self.lbounds, self.ubounds)
+        if self._other_priors:
+            # The rows outside the bounds are already -inf, and the priors may not be defined there
+            m = isfinite(lnp)
+            for i, prior in self._other_priors:
+                lnp[m] += prior.logpdf(pv[m, i])
+        return squeeze(lnp)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for p in self:
+            p._add_owner(self)
+        self._priors_dirty = True
 
     def freeze(self):
         self._update_indices()
@@ -198,6 +318,11 @@ class ParameterSet(list):
 
 
     def find_pid(self, name):
+        if self.frozen:
+            try:
+                return self._name_to_pid[name]
+            except KeyError:
+                raise KeyError('Could not find parameter {}'.format(name)) from None
         for p in self:
             if name == p.name:
                 return p.pid
@@ -205,7 +330,18 @@ class ParameterSet(list):
 
 
     def sample_from_prior(self, size=1):
-        return stack([p.rvs(size) for p in self.priors], 1)
+        if self._priors_dirty or not self.frozen:
+            self._flatten_priors()
+        pvp = zeros((size, len(self)))
+        pids, mean, std = self._rvs_normal
+        pvp[:, pids] = normal(mean, std, (size, pids.size))
+        pids, a, b = self._rvs_uniform
+        pvp[:, pids] = uniform(a, b, (size, pids.size))
+        pids, a, b = self._rvs_jeffreys
+        pvp[:, pids] = exp(uniform(a, b, (size, pids.size)))
+        for i, prior in self._rvs_other:
+            pvp[:, i] = prior.rvs(size)
+        return pvp
 
     def check_pv(self, pv):
         for i, p in enumerate(self):
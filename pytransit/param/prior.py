@@ -16,12 +16,60 @@
 
 import math as m
 
+from copy import copy
+
+from numba import njit, vectorize
 from numpy import inf, zeros, pi, log, where, exp
 from numpy.random import normal, uniform
 from scipy.stats import gamma as gm
 
 
+@njit(cache=False)
+def normal_logpdf_s(x, mean, f2, lf1):
+    return lf1 - f2*(x - mean)**2
+
+
+@njit(cache=False)
+def uniform_logpdf_s(x, a, b, lnc):
+    return lnc if a < x < b else -inf
+
+
+@njit(cache=False)
+def jeffreys_logpdf_s(x, x0, x1, f):
+    return -m.log(x * f) if x0 < x < x1 else -inf
+
+
+@njit(cache=False)
+def gamma_logpdf_s(x, a, A):
+    return A + (a - 1.)*m.log(x) - x
+
+
+@vectorize(['f8(f8, f8, f8, f8)'], nopython=True, cache=False)
+def normal_logpdf(x, mean, f2, lf1):
+    return normal_logpdf_s(x, mean, f2, lf1)
+
+
+@vectorize(['f8(f8, f8, f8, f8)'], nopython=True, cache=False)
+def uniform_logpdf(x, a, b, lnc):
+    return uniform_logpdf_s(x, a, b, lnc)
+
+
+@vectorize(['f8(f8, f8, f8, f8)'], nopython=True, cache=False)
+def jeffreys_logpdf(x, x0, x1, f):
+    return jeffreys_logpdf_s(x, x0, x1, f)
+
+
+@vectorize(['f8(f8, f8, f8)'], nopython=True, cache=False)
+def gamma_logpdf(x, a, A):
+    return gamma_logpdf_s(x, a, A)
+
+
 class Prior:
+    # Prior type code for the compiled ParameterSet prior evaluation, where the log density is
+    # evaluated from `self._kernel_args`: 0 = no compiled kernel, 1 = normal, 2 = uniform,
+    # 3 = Jeffreys, 4 = gamma.
+    _kind = 0
+
     def __init__(self):
         raise NotImplementedError
 
@@ -41,6 +89,8 @@ class DefaultPrior(Prior):
 
 
 class NormalPrior(Prior):
+    _kind = 1
+
     def __init__(self, mean: float, std: float):
         self.mean = float(mean)
         self.std = float(std)
@@ -48,8 +98,18 @@ class NormalPrior(Prior):
         self._lf1 = m.log(self._f1)
         self._f2 = 1 / (2*std**2)
 
+    @property
+    def _kernel_args(self):
+        return self.mean, self._f2, self._lf1
+
     def logpdf(self, x):
-        return self._lf1 - self._f2*(x - self.mean)**2
+        return normal_logpdf(x, self.mean, self._f2, self._lf1)
+
+    def with_mean(self, mean: float):
+        """Returns a copy of the prior centred on `mean` that reuses the precomputed normalisation."""
+        prior = copy(self)
+        prior.mean = float(mean)
+        return prior
 
     def rvs(self, size=1):
         return normal(self.mean, self.std, size)
@@ -62,12 +122,18 @@ class NormalPrior(Prior):
 
 
 class UniformPrior(Prior):
+    _kind = 2
+
     def __init__(self, a: float, b: float):
         self.a, self.b = a, b
         self.lnc = m.log(b-a)
 
+    @property
+    def _kernel_args(self):
+        return self.a, self.b, self.lnc
+
     def logpdf(self, v):
-        return where((self.a < v) & (v < self.b), self.lnc, -inf)
+        return uniform_logpdf(v, self.a, self.b, self.lnc)
 
     def rvs(self, size=1):
         return uniform(self.a, self.b, size)
@@ -80,16 +146,22 @@ class UniformPrior(Prior):
 
 
 class JeffreysPrior(Prior):
+    _kind = 3
+
     def __init__(self, x0: float, x1: float):
         self.x0 = x0
         self.x1 = x1
         self._f = log(x1 / x0)
 
+    @property
+    def _kernel_args(self):
+        return self.x0, self.x1, self._f
+
     def pdf(self, x):
         return where((x > self.x0) & (x < self.x1), 1. / (x * self._f), -inf)
 
     def logpdf(self, x):
-        return where((x > self.x0) & (x < self.x1), -log(x * self._f), -inf)
+        return jeffreys_logpdf(x, self.x0, self.x1, self._f)
 
     def rvs(self, size=1):
         return exp(uniform(log(self.x0), log(self.x1), size))
@@ -111,12 +183,18 @@ class LogLogisticPrior(Prior):
 
 
 class GammaPrior(Prior):
+    _kind = 4
+
     def __init__(self, a):
         self.a = a
         self.A = -m.lgamma(a)
 
+    @property
+    def _kernel_args(self):
+        return self.a, self.A
+
     def logpdf(self, x):
-        return self.A + (self.a - 1.) * log(x) - x
+        return gamma_logpdf(x, self.a, self.A)
 
     def rvs(self, size):
         return gm(self.a).rvs(size)
@@ -0,0 +1,185 @@
+#  PyTransit: fast and easy exoplanet transit modelling in Python.
+#  Copyright (C) 2010-2020  Hannu Parviainen
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from pickle import dumps, loads
+from numpy import array, zeros, inf, isfinite, where, all, log, linspace
+from numpy.random import seed
+from numpy.testing import assert_allclose
+from scipy.stats import norm, loguniform, gamma
+
+from pytransit.param.parameter import ParameterSet, GParameter, LParameter
+from pytransit.param.prior import (NormalPrior as NP, UniformPrior as UP, GammaPrior as GM, JeffreysPrior as JP,
+                                   DefaultPrior, Prior)
+
+
+class ShiftedNormalPrior(NP):
+    """A normal prior subclass overriding logpdf."""
+    def logpdf(self, x):
+        return super().logpdf(x) + 1.0
+
+
+class BetaLikePrior(Prior):
+    """A prior without a compiled kernel that returns nan outside (0, 1)."""
+    def __init__(self):
+        pass
+
+    def logpdf(self, x):
+        return log(x) + log(1.0 - x)
+
+
+def reference_logpdf(prior, x):
+    """Prior log densities computed independently of the PyTransit prior kernels."""
+    if isinstance(prior, NP):
+        return norm(prior.mean, prior.std).logpdf(x)
+    elif isinstance(prior, UP):
+        # PyTransit's uniform prior uses log(b - a) as the in-range constant
+        return where((x > prior.a) & (x < prior.b), log(prior.b - prior.a), -inf)
+    elif isinstance(prior, JP):
+        return loguniform(prior.x0, prior.x1).logpdf(x)
+    elif isinstance(prior, GM):
+        return gamma(prior.a).logpdf(x)
+    elif isinstance(prior, DefaultPrior):
+        return zeros(x.shape)
+    raise NotImplementedError
+
+
+class TestPriors(unittest.TestCase):
+    """Test the compiled prior log densities against scipy.stats.
+    """
+    def test_normal(self):
+        x = linspace(-2.0, 4.0, 25)
+        assert_allclose(NP(1.0, 0.5).logpdf(x), norm(1.0, 0.5).logpdf(x))
+        assert_allclose(NP(1.0, 0.5).logpdf(1.0), -log(0.5) - 0.5*log(2*3.141592653589793))
+
+    def test_live_attributes(self):
+        prior = NP(1.0, 0.5)
+        prior.mean = 2.0
+        assert_allclose(prior.logpdf(2.0), norm(2.0, 0.5).logpdf(2.0))
+        prior = UP(0.0, 2.0)
+        prior.a = 1.0
+        assert_allclose(prior.logpdf(array([0.5, 1.5])), [-inf, log(2)])
+
+    def test_uniform(self):
+        assert_allclose(UP(0.0, 2.0).logpdf(array([-1.0, 0.5, 1.0, 3.0])), [-inf, log(2), log(2), -inf])
+
+    def test_jeffreys(self):
+        x = linspace(0.02, 0.9, 25)
+        assert_allclose(JP(0.01, 1.0).logpdf(x), loguniform(0.01, 1.0).logpdf(x))
+        assert_allclose(JP(0.01, 1.0).logpdf(array([0.005, 1.5])), [-inf, -inf])
+
+    def test_gamma(self):
+        x = linspace(0.1, 10.0, 25)
+        assert_allclose(GM(2.5).logpdf(x), gamma(2.5).logpdf(x))
+
+
+class TestParameterSet(unittest.TestCase):
+    """Test the vectorised prior evaluation of the ParameterSet.
+    """
+    def setUp(self):
+        seed(0)
+        self.ps = ParameterSet()
+        self.ps.add_global_block('orbit', [GParameter('tc', 'zero_epoch', 'd', NP(1.0, 0.01), (-inf, inf)),
+                                           GParameter('rho', 'stellar_density', 'g/cm^3', UP(0.1, 25.0), (0, inf)),
+                                           GParameter('b', 'impact_parameter', 'R_s', UP(0.0, 1.0), (0, 1)),
+                                           GParameter('q', 'shape', '', GM(2.0), (0, inf)),
+                                           GParameter('s', 'scale', '', JP(0.01, 1.0), (0, inf))])
+        self.ps.add_lightcurve_block('noise', 1, 2, [LParameter('e_0', 'error', '', None, (0, inf)),
+                                                     LParameter('e_1', 'error', '', None, (0, inf))])
+        self.ps.freeze()
+        self.pvp = self.ps.sample_from_prior(50)
+        self.pvp[:, 5:] = 0.1
+
+    def reference_lnprior(self, pvp):
+        lnp = zeros(pvp.shape[0])
+        for i, p in enumerate(self.ps):
+            lnp += reference_logpdf(p.prior, pvp[:, i])
+        m = all(pvp > self.ps.bounds[:, 0], 1) & all(pvp < self.ps.bounds[:, 1], 1)
+        return where(m, lnp, -inf)
+
+    def test_lnprior(self):
+        assert_allclose(self.ps.lnprior(self.pvp), self.reference_lnprior(self.pvp))
+
+    def test_lnprior_out_of_bounds(self):
+        pvp = self.pvp.copy()
+        pvp[::2, 2] = 1.5
+        lnp = self.ps.lnprior(pvp)
+        assert not any(isfinite(lnp[::2]))
+        assert_allclose(lnp[1::2], self.reference_lnprior(pvp)[1::2])
+
+    def test_lnprior_1d(self):
+        assert_allclose(self.ps.lnprior(self.pvp[0]), self.reference_lnprior(self.pvp[:1])[0])
+
+    def test_lnprior_after_prior_change(self):
+        self.ps[0].prior = NP(1.005, 0.02)
+        self.ps[1].prior = NP(2.0, 1.0)
+        assert_allclose(self.ps.lnprior(self.pvp), self.reference_lnprior(self.pvp))
+
+    def test_find_pid(self):
+        self.assertEqual(self.ps.find_pid('b'), 2)
+        self.assertEqual(self.ps.find_pid('e_1'), 6)
+        self.assertRaises(KeyError, self.ps.find_pid, 'k2')
+
+    def test_sample_from_prior(self):
+        pvp = self.ps.sample_from_prior(10000)
+        self.assertEqual(pvp.shape, (10000, 7))
+        assert_allclose(pvp[:, 0].mean(), 1.0, atol=1e-3)
+        assert_allclose(pvp[:, 0].std(), 0.01, rtol=0.05)
+        assert all((pvp[:, 1] > 0.1) & (pvp[:, 1] < 25.0))
+        assert all((pvp[:, 2] > 0.0) & (pvp[:, 2] < 1.0))
+        assert all(pvp[:, 3] > 0.0)
+        assert all((pvp[:, 4] > 0.01) & (pvp[:, 4] < 1.0))
+        assert all(pvp[:, 5:] == 0.0)
+
+    def test_prior_change_marks_only_owners(self):
+        ps2 = ParameterSet([GParameter('k2', 'area_ratio', 'A_s', UP(0.01, 0.1), (0, 1))])
+        ps2.freeze()
+        ps2.lnprior(array([0.05]))
+        self.ps[0].prior = NP(1.005, 0.02)
+        assert self.ps._priors_dirty
+        assert not ps2._priors_dirty
+
+    def test_lnprior_after_pickling(self):
+        ps = loads(dumps(self.ps))
+        ps[1].prior = NP(2.0, 1.0)
+        self.ps = ps
+        assert_allclose(ps.lnprior(self.pvp), self.reference_lnprior(self.pvp))
+
+    def test_lnprior_wrong_width(self):
+        self.assertRaises(ValueError, self.ps.lnprior, self.pvp[:, :-1])
+        self.ps.thaw()
+        self.ps.append(GParameter('k2', 'area_ratio', 'A_s', UP(0.01, 0.1), (0, 1)))
+        self.assertRaises(ValueError, self.ps.lnprior, self.pvp)
+        self.assertRaises(ValueError, self.ps.lnprior, zeros((2, 8)))
+
+    def test_lnprior_other_prior_out_of_bounds(self):
+        self.ps.thaw()
+        self.ps.append(GParameter('f', 'fraction', '', BetaLikePrior(), (0, 1)))
+        self.ps.freeze()
+        pvp = array([[1.0, 1.0, 0.5, 1.0, 0.1, 0.1, 0.1, 0.25],
+                     [1.0, 1.0, 0.5, 1.0, 0.1, 0.1, 0.1, 1.50],
+                     [1.0, 1.0, 1.5, 1.0, 0.1, 0.1, 0.1, 0.25]])
+        lnp = self.ps.lnprior(pvp)
+        assert isfinite(lnp[0])
+        lnp_ref = sum(reference_logpdf(p.prior, pvp[0, i]) for i, p in enumerate(self.ps[:-1]))
+        assert_allclose(lnp[0], lnp_ref + log(0.25) + log(0.75))
+        self.assertEqual(lnp[1], -inf)
+        self.assertEqual(lnp[2], -inf)
+
+    def test_lnprior_prior_subclass(self):
+        lnp0 = self.ps.lnprior(self.pvp)
+        self.ps[0].prior = ShiftedNormalPrior(1.0, 0.01)
+        assert_allclose(self.ps.lnprior(self.pvp), lnp0 + 1.0)
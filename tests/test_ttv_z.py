@@ -0,0 +1,111 @@
+#  PyTransit: fast and easy exoplanet transit modelling in Python.
+#  Copyright (C) 2010-2020  Hannu Parviainen
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from math import pi
+from numpy import s_, isfinite, all, array, linspace, concatenate, full, sin, cos, sign, sqrt, cumsum, percentile
+from numpy.random import seed, normal
+from numpy.testing import assert_allclose
+
+from pytransit.orbits.orbits_py import as_from_rhop, i_from_ba
+from pytransit.lpf.ttvlpf import TTVLPF, with_jax
+from pytransit.lpf.ttvlpf import z_circular_ttv, z2_circular_ttv, z_circular_ttv_recur, z_circular_ttv_sliced, multi_percentile
+
+if with_jax:
+    import jax
+    import jax.numpy as jnp
+    jax.config.update('jax_enable_x64', True)
+
+
+class TestCircularTTVZ(unittest.TestCase):
+    """Test the routines to calculate z for the TTV log posterior function.
+    """
+    def setUp(self):
+        self.p, self.a, self.i = 2.5, 8.0, 0.48 * pi
+        self.tc = array([0.001, 2.498, 5.003])
+        times = [linspace(tc - 0.15, tc + 0.15, 500) for tc in self.tc]
+        times[1] = concatenate([times[1][:200], times[1][250:]])
+        self.t = concatenate(times)
+        self.lcbounds = concatenate([[0], cumsum([t.size for t in times])])
+        self.tcid = concatenate([full(t.size, i, 'int64') for i, t in enumerate(times)])
+        cosph = cos(2*pi * (self.t - self.tc[self.tcid]) / self.p)
+        self.z_truth = sign(cosph) * self.a * sqrt(1.0 - cosph**2 * sin(self.i)**2)
+
+    def test_z_circular_ttv(self):
+        z = z_circular_ttv(self.t, self.p, self.a, self.i, self.tc, self.tcid)
+        assert_allclose(z, self.z_truth, rtol=1e-10, atol=1e-10)
+
+    def test_z2_circular_ttv(self):
+        z2 = z2_circular_ttv(self.t, self.p, self.a, self.i, self.tc, self.tcid)
+        assert_allclose(z2, self.z_truth**2, rtol=1e-10, atol=1e-10)
+
+    def test_z_circular_ttv_recur(self):
+        z = z_circular_ttv_recur(self.t, self.p, self.a, sin(self.i)**2, self.tc, self.tcid)
+        assert_allclose(z, self.z_truth, rtol=1e-8, atol=1e-8)
+
+    def test_z_circular_ttv_sliced(self):
+        z = z_circular_ttv_sliced(self.t, self.p, self.a, self.i, self.tc, self.lcbounds)
+        assert_allclose(z, self.z_truth, rtol=1e-10, atol=1e-10)
+
+
+class TestMultiPercentile(unittest.TestCase):
+    def test_multi_percentile(self):
+        seed(0)
+        x = normal(size=(1001, 7))
+        q = array([50, 16, 84, 0.5, 99.5, 0, 100])
+        assert_allclose(multi_percentile(x, q), percentile(x, q, 0), rtol=1e-12, atol=1e-12)
+
+
+@unittest.skipUnless(with_jax, 'JAX is not installed')
+class TestCircularTTVZJax(unittest.TestCase):
+    """Test the JAX implementation of the TTV z computation.
+    """
+    def setUp(self):
+        self.p, self.rho, self.b = 2.5, 1.4, 0.3
+        self.tc = array([0.001, 2.498, 5.003])
+        times = [linspace(tc - 0.15, tc + 0.15, 500) for tc in self.tc]
+        self.lcbounds = concatenate([[0], cumsum([t.size for t in times])])
+
+        # Only the attributes used by _compute_z_jax are set, the full LPF initialisation is not needed.
+        self.lpf = TTVLPF.__new__(TTVLPF)
+        self.lpf.period = self.p
+        self.lpf.timea = concatenate(times)
+        self.lpf.lcids = concatenate([full(t.size, i, 'int64') for i, t in enumerate(times)])
+        self.lpf._sl_tc = s_[2:5]
+        self.pv = jnp.array([self.rho, self.b, *self.tc])
+
+    def test_compute_z_jax(self):
+        a = as_from_rhop(self.rho, self.p)
+        i = i_from_ba(self.b, a)
+        z_truth = z_circular_ttv_sliced(self.lpf.timea, self.p, a, i, self.tc, self.lcbounds)
+        assert_allclose(self.lpf._compute_z_jax(self.pv), z_truth, rtol=1e-8, atol=1e-8)
+
+    def test_compute_z_jax_grad(self):
+        f = lambda pv: self.lpf._compute_z_jax(pv).sum()
+        g = jax.grad(f)(self.pv)
+        assert all(isfinite(g))
+
+        eps = 1e-6
+        for j in range(5):
+            dpv = jnp.zeros(5).at[j].set(eps)
+            assert_allclose(g[j], (f(self.pv + dpv) - f(self.pv - dpv)) / (2*eps), rtol=1e-4, atol=1e-6)
+
+    def test_compute_z_jax_requires_x64(self):
+        jax.config.update('jax_enable_x64', False)
+        try:
+            self.assertRaises(RuntimeError, self.lpf._compute_z_jax, self.pv)
+        finally:
+            jax.config.update('jax_enable_x64', True)
@@ -0,0 +1,55 @@
+#  PyTransit: fast and easy exoplanet transit modelling in Python.
+#  Copyright (C) 2010-2020  Hannu Parviainen
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+from types import SimpleNamespace
+from numpy import linspace, zeros
+from numpy.testing import assert_allclose
+
+from pytransit.lpf.ttvlpf import TTVLPF
+
+
+class TestTTVLPFPosterior(unittest.TestCase):
+    """Test the TTVLPF posterior transit centre reductions.
+    """
+    def setUp(self):
+        # Only the attributes needed by the parametrisation and the posterior access are set.
+        self.lpf = lpf = TTVLPF.__new__(TTVLPF)
+        lpf.zero_epoch, lpf.period, lpf.tc_sigma = 0.0, 2.0, 0.01
+        lpf.passbands, lpf.npb = ['Kepler'], 1
+        self.times = [linspace(2.0*n - 0.1, 2.0*n + 0.1, 20) for n in range(4)]
+        self.init(self.times)
+
+    def init(self, times):
+        self.lpf.times, self.lpf.nlc = times, len(times)
+        self.lpf._init_parameters()
+
+    def set_samples(self, t0, p):
+        """Creates a fake sampler whose transit centres follow a linear ephemeris."""
+        chain = zeros((4, 10, len(self.lpf.ps)))
+        chain[:, :, self.lpf._sl_tc] = t0 + p * self.lpf.tnumber
+        self.lpf.sampler = SimpleNamespace(chain=chain, iteration=10)
+
+    def test_posterior_period(self):
+        self.set_samples(0.001, 2.0005)
+        assert_allclose(self.lpf.posterior_period(), 2.0005)
+
+    def test_posterior_period_after_removing_a_transit(self):
+        self.set_samples(0.001, 2.0005)
+        assert_allclose(self.lpf.posterior_period(), 2.0005)
+        self.init([t for i, t in enumerate(self.times) if i != 1])
+        self.set_samples(0.002, 2.001)
+        assert_allclose(self.lpf.posterior_period(), 2.001)